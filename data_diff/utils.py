@@ -1,9 +1,10 @@
+import atexit
 import json
 import logging
-import math
 import re
 import string
 from abc import abstractmethod
+from functools import lru_cache
 from typing import Any, Dict, Iterable, Iterator, List, MutableMapping, Optional, Sequence, TypeVar, Union
 from urllib.parse import urlparse
 import operator
@@ -20,6 +21,12 @@ from typing_extensions import Self
 from data_diff.version import __version__
 from rich.status import Status
 
+try:
+    # google-re2 guarantees linear-time matching, when it's installed
+    import re2 as _like_re
+except ImportError:
+    _like_re = re
+
 
 # -- Common --
 
@@ -43,19 +50,23 @@ def safezip(*args):
     return zip(*args)
 
 
-UUID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.I)
+def _zip_checked(a: Sequence, b: Sequence):
+    "safezip() specialized for two sequences"
+    if len(a) != len(b):
+        raise ValueError(f"Mismatching lengths in arguments to safezip: {[len(a), len(b)]}")
+    return zip(a, b)
 
 
 def is_uuid(u: str) -> bool:
     # E.g., hashlib.md5(b'hello') is a 32-letter hex number, but not an UUID.
     # It would fail UUID-like comparison (< & >) because of casing and dashes.
-    if not UUID_PATTERN.fullmatch(u):
+    if len(u) != 36 or u[8] != "-" or u[13] != "-" or u[18] != "-" or u[23] != "-":
         return False
     try:
-        UUID(u)
+        # bytes.fromhex() skips whitespace, so also check that we got all 16 bytes
+        return len(bytes.fromhex(u[:8] + u[9:13] + u[14:18] + u[19:23] + u[24:])) == 16
     except ValueError:
         return False
-    return True
 
 
 def match_regexps(regexps: Dict[str, Any], s: str) -> Sequence[tuple]:
@@ -82,28 +93,34 @@ class CaseAwareMapping(MutableMapping[str, V]):
 class CaseInsensitiveDict(CaseAwareMapping):
     def __init__(self, initial) -> None:
         super().__init__()
-        self._dict = {k.lower(): (k, v) for k, v in dict(initial).items()}
+        if not isinstance(initial, dict):
+            initial = dict(initial)
+        lower_keys = list(map(str.lower, initial))
+        # Values and original keys are kept in parallel dicts, so lookups don't need to unpack a tuple
+        self._values = dict(zip(lower_keys, initial.values()))
+        self._orig_keys = dict(zip(lower_keys, initial))
 
     def __getitem__(self, key: str) -> V:
-        return self._dict[key.lower()][1]
+        return self._values[str.lower(key)]
 
     def __iter__(self) -> Iterator[V]:
-        return iter(self._dict)
+        return iter(self._values)
 
     def __len__(self) -> int:
-        return len(self._dict)
+        return len(self._values)
 
     def __setitem__(self, key: str, value) -> None:
-        k = key.lower()
-        if k in self._dict:
-            key = self._dict[k][0]
-        self._dict[k] = key, value
+        k = str.lower(key)
+        self._values[k] = value
+        self._orig_keys.setdefault(k, key)
 
     def __delitem__(self, key: str) -> None:
-        del self._dict[key.lower()]
+        k = str.lower(key)
+        del self._values[k]
+        del self._orig_keys[k]
 
     def get_key(self, key: str) -> str:
-        return self._dict[key.lower()][0]
+        return self._orig_keys[str.lower(key)]
 
     def __repr__(self) -> str:
         return repr(dict(self.items()))
@@ -121,6 +138,12 @@ class CaseSensitiveDict(dict, CaseAwareMapping):
 # -- Alphanumerics --
 
 alphanums = " -" + string.digits + string.ascii_uppercase + "_" + string.ascii_lowercase
+_ALPHANUMS_IDX = {c: i for i, c in enumerate(alphanums)}
+_ALPHANUMS_LEN = len(alphanums)
+_ALPHANUMS_SET = frozenset(alphanums)
+_ALPHANUMS_BYTES = alphanums.encode("ascii")
+# Each digit holds at least this many bits (65 >= 2**6)
+_ALPHANUMS_BITS_PER_DIGIT = _ALPHANUMS_LEN.bit_length() - 1
 
 
 @attrs.define(frozen=True)
@@ -135,93 +158,207 @@ class ArithString:
         return [self.new(int=i) for i in checkpoints]
 
 
-def _any_to_uuid(v: Union[str, int, UUID, "ArithUUID"]) -> UUID:
+_UUID_INT_LIMIT = 1 << 128
+
+
+def _check_uuid_int(v: int) -> int:
+    if not 0 <= v < _UUID_INT_LIMIT:
+        raise ValueError("int is out of range (need a 128-bit value)")
+    return v
+
+
+@lru_cache(maxsize=4096)
+def _uuid_int_from_str(s: str) -> int:
+    # The same key strings come up repeatedly while bisecting, so don't reparse them every time
+    return UUID(s).int
+
+
+def _any_to_uuid_int(v: Union[str, int, UUID, "ArithUUID"]) -> int:
     if isinstance(v, ArithUUID):
-        return v.uuid
+        return v._int
     elif isinstance(v, UUID):
-        return v
+        return v.int
     elif isinstance(v, str):
-        return UUID(v)
+        return _uuid_int_from_str(v)
     elif isinstance(v, int):
-        return UUID(int=v)
+        return _check_uuid_int(v)
     else:
         raise ValueError(f"Cannot convert a value to UUID: {v!r}")
 
 
-@attrs.define(frozen=True, eq=False, order=False)
+@attrs.define(frozen=True, eq=False, order=False, repr=False)
 class ArithUUID(ArithString):
     "A UUID that supports basic arithmetic (add, sub)"
 
-    uuid: UUID = attrs.field(converter=_any_to_uuid)
+    # Stored as a plain int, since all the arithmetic and comparisons happen on ints.
+    # The UUID object is only built when rendering.
+    _int: int = attrs.field(converter=_any_to_uuid_int, alias="uuid")
     lowercase: Optional[bool] = None
     uppercase: Optional[bool] = None
 
+    @property
+    def uuid(self) -> UUID:
+        return UUID(int=self._int)
+
+    def _fast_evolve_int(self, new_int: int) -> Self:
+        # Like attrs.evolve(self, uuid=new_int), but skips the generic field sweep and the converter
+        obj = object.__new__(type(self))
+        object.__setattr__(obj, "_int", _check_uuid_int(new_int))
+        object.__setattr__(obj, "lowercase", self.lowercase)
+        object.__setattr__(obj, "uppercase", self.uppercase)
+        return obj
+
     def range(self, other: "ArithUUID", count: int) -> List[Self]:
         assert isinstance(other, ArithUUID)
-        checkpoints = split_space(self.uuid.int, other.uuid.int, count)
-        return [attrs.evolve(self, uuid=i) for i in checkpoints]
+        checkpoints = split_space(self._int, other._int, count)
+        return [self._fast_evolve_int(i) for i in checkpoints]
 
     def __int__(self) -> int:
-        return self.uuid.int
+        return self._int
 
     def __add__(self, other: int) -> Self:
         if isinstance(other, int):
-            return attrs.evolve(self, uuid=self.uuid.int + other)
+            return self._fast_evolve_int(self._int + other)
         return NotImplemented
 
     def __sub__(self, other: Union["ArithUUID", int]):
         if isinstance(other, int):
-            return attrs.evolve(self, uuid=self.uuid.int - other)
+            return self._fast_evolve_int(self._int - other)
         elif isinstance(other, ArithUUID):
-            return self.uuid.int - other.uuid.int
+            return self._int - other._int
         return NotImplemented
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid == other.uuid
+            return self._int == other._int
         return NotImplemented
 
     def __ne__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid != other.uuid
+            return self._int != other._int
         return NotImplemented
 
     def __gt__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid > other.uuid
+            return self._int > other._int
         return NotImplemented
 
     def __lt__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid < other.uuid
+            return self._int < other._int
         return NotImplemented
 
     def __ge__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid >= other.uuid
+            return self._int >= other._int
         return NotImplemented
 
     def __le__(self, other: object) -> bool:
         if isinstance(other, ArithUUID):
-            return self.uuid <= other.uuid
+            return self._int <= other._int
         return NotImplemented
 
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__qualname__}(uuid={self.uuid!r}, lowercase={self.lowercase!r}, uppercase={self.uppercase!r})"
+        )
+
+
+# Strings with fewer digits than this are converted digit-by-digit.
+# Longer ones are split in half recursively, which is subquadratic in the digit count.
+_DIVIDE_AND_CONQUER_MIN_DIGITS = 32
+_DIVIDE_AND_CONQUER_MIN_LOG2 = _DIVIDE_AND_CONQUER_MIN_DIGITS.bit_length() - 1
+
+_base_squares_cache: Dict[int, List[int]] = {}
+
+
+def _base_squares(base_len: int, n_digits: int) -> List[int]:
+    "Returns [base_len**1, base_len**2, base_len**4, ...], long enough to split a number of n_digits digits"
+    squares = _base_squares_cache.get(base_len, [base_len])
+    if (1 << (len(squares) - 1)) < n_digits:
+        squares = list(squares)
+        while (1 << (len(squares) - 1)) < n_digits:
+            squares.append(squares[-1] * squares[-1])
+        _base_squares_cache[base_len] = squares
+    return squares
+
+
+def _numberToAlphanum_simple(num: int, base: str) -> str:
+    if base is alphanums:
+        # Fast path: fill a byte buffer right-to-left, sized by an upper bound on the number of digits
+        i = num.bit_length() // _ALPHANUMS_BITS_PER_DIGIT + 1
+        buf = bytearray(i)
+        while num > 0:
+            i -= 1
+            num, remainder = divmod(num, _ALPHANUMS_LEN)
+            buf[i] = _ALPHANUMS_BYTES[remainder]
+        return buf[i:].decode("ascii")
 
-def numberToAlphanum(num: int, base: str = alphanums) -> str:
     digits = []
+    base_len = len(base)
     while num > 0:
-        num, remainder = divmod(num, len(base))
+        num, remainder = divmod(num, base_len)
         digits.append(remainder)
     return "".join(base[i] for i in digits[::-1])
 
 
-def alphanumToNumber(alphanum: str, base: str = alphanums) -> int:
+def _numberToAlphanum_dc(num: int, base: str, squares: List[int]) -> str:
+    if num < squares[_DIVIDE_AND_CONQUER_MIN_LOG2]:
+        return _numberToAlphanum_simple(num, base)
+
+    k = len(squares) - 1
+    while squares[k] > num:
+        k -= 1
+    high, low = divmod(num, squares[k])
+    return _numberToAlphanum_dc(high, base, squares) + _numberToAlphanum_dc(low, base, squares).rjust(1 << k, base[0])
+
+
+def numberToAlphanum(num: int, base: str = alphanums) -> str:
+    base_len = len(base)
+    # Upper bound on the number of digits
+    n_digits = num.bit_length() // (base_len.bit_length() - 1) + 1
+    if n_digits < _DIVIDE_AND_CONQUER_MIN_DIGITS:
+        return _numberToAlphanum_simple(num, base)
+    return _numberToAlphanum_dc(num, base, _base_squares(base_len, n_digits))
+
+
+def _alphanumToNumber_simple(alphanum: str, base: str) -> int:
     num = 0
+    if base is alphanums:
+        # Fast path: O(1) lookup instead of scanning the base for every char
+        idx = _ALPHANUMS_IDX
+        try:
+            for c in alphanum:
+                num = num * _ALPHANUMS_LEN + idx[c]
+        except KeyError:
+            raise ValueError(f"Unexpected character {c!r} in alphanum string") from None
+        return num
+
+    base_len = len(base)
     for c in alphanum:
-        num = num * len(base) + base.index(c)
+        num = num * base_len + base.index(c)
     return num
 
 
+def _alphanumToNumber_dc(alphanum: str, base: str, squares: List[int]) -> int:
+    n = len(alphanum)
+    if n < _DIVIDE_AND_CONQUER_MIN_DIGITS:
+        return _alphanumToNumber_simple(alphanum, base)
+
+    # Split off the largest power-of-two suffix that is shorter than the whole string
+    k = (n - 1).bit_length() - 1
+    half = 1 << k
+    high = _alphanumToNumber_dc(alphanum[:-half], base, squares)
+    low = _alphanumToNumber_dc(alphanum[-half:], base, squares)
+    return high * squares[k] + low
+
+
+def alphanumToNumber(alphanum: str, base: str = alphanums) -> int:
+    if len(alphanum) < _DIVIDE_AND_CONQUER_MIN_DIGITS:
+        return _alphanumToNumber_simple(alphanum, base)
+    return _alphanumToNumber_dc(alphanum, base, _base_squares(len(base), len(alphanum)))
+
+
 def justify_alphanums(s1: str, s2: str):
     max_len = max(len(s1), len(s2))
     s1 = s1.ljust(max_len)
@@ -245,11 +382,11 @@ class ArithAlphanumeric(ArithString):
         if self._str is None:
             raise ValueError("Alphanum string cannot be None")
         if self._max_len and len(self._str) > self._max_len:
-            raise ValueError(f"Length of alphanum value '{str}' is longer than the expected {self._max_len}")
+            raise ValueError(f"Length of alphanum value '{self._str}' is longer than the expected {self._max_len}")
 
-        for ch in self._str:
-            if ch not in alphanums:
-                raise ValueError(f"Unexpected character {ch} in alphanum string")
+        if not _ALPHANUMS_SET.issuperset(self._str):
+            ch = next(ch for ch in self._str if ch not in _ALPHANUMS_SET)
+            raise ValueError(f"Unexpected character {ch} in alphanum string")
 
     # @property
     # def int(self):
@@ -308,34 +445,51 @@ class ArithAlphanumeric(ArithString):
         return type(self)(*args, **kw, max_len=self._max_len)
 
 
+_HUMAN_MAGNITUDES = ((1e9, "b"), (1e6, "m"), (1e3, "k"))
+
+
 def number_to_human(n):
-    millnames = ["", "k", "m", "b"]
     n = float(n)
-    millidx = max(
-        0,
-        min(len(millnames) - 1, int(math.floor(0 if n == 0 else math.log10(abs(n)) / 3))),
-    )
-
-    return "{:.0f}{}".format(n / 10 ** (3 * millidx), millnames[millidx])
+    a = abs(n)
+    for threshold, suffix in _HUMAN_MAGNITUDES:
+        if a >= threshold:
+            return f"{n / threshold:.0f}{suffix}"
+    return f"{n:.0f}"
 
 
 def split_space(start, end, count) -> List[int]:
     size = end - start
     assert count <= size, (count, size)
-    return list(range(start, end, (size + 1) // (count + 1)))[1 : count + 1]
+    # Slice the range object itself, so only the returned checkpoints get materialized
+    return list(range(start, end, (size + 1) // (count + 1))[1 : count + 1])
+
+
+def _scrub_password(_value, replace_with: str):
+    return replace_with
+
+
+def _scrub_filepath(value, replace_with: str):
+    if isinstance(value, str) and "motherduck_token=" in value:
+        return value.split("motherduck_token=")[0] + f"motherduck_token={replace_with}"
+    return value
+
+
+_SCRUB_ACTIONS = {"password": _scrub_password, "filepath": _scrub_filepath}
 
 
 def remove_passwords_in_dict(d: dict, replace_with: str = "***"):
-    for k, v in d.items():
-        if k == "password":
-            d[k] = replace_with
-        elif k == "filepath":
-            if "motherduck_token=" in v:
-                d[k] = v.split("motherduck_token=")[0] + f"motherduck_token={replace_with}"
-        elif isinstance(v, dict):
-            remove_passwords_in_dict(v, replace_with)
-        elif k.startswith("database"):
-            d[k] = remove_password_from_url(v, replace_with)
+    # Walk nested dicts with an explicit stack, so deep configs can't hit the recursion limit
+    stack = [d]
+    while stack:
+        cur = stack.pop()
+        for k, v in cur.items():
+            action = _SCRUB_ACTIONS.get(k)
+            if action:
+                cur[k] = action(v, replace_with)
+            elif isinstance(v, dict):
+                stack.append(v)
+            elif k.startswith("database"):
+                cur[k] = remove_password_from_url(v, replace_with)
 
 
 def _join_if_any(sym, args):
@@ -360,10 +514,29 @@ def remove_password_from_url(url: str, replace_with: str = "***") -> str:
         return replaced.geturl()
 
 
+_LIKE_TOKEN_RE = re.compile(r"([%?])|([.^$*+()\[\]{}|\\])")
+_LIKE_WILDCARDS = {"%": ".*", "?": "."}
+
+
+def _like_token_to_re(m: re.Match) -> str:
+    wildcard, literal = m.groups()
+    return _LIKE_WILDCARDS[wildcard] if wildcard else "\\" + literal
+
+
+def _like_to_re(pattern: str) -> str:
+    "Translates a LIKE pattern to a regexp in a single scan, escaping regexp metacharacters"
+    return _LIKE_TOKEN_RE.sub(_like_token_to_re, pattern) + "$"
+
+
+@lru_cache(maxsize=256)
+def _compile_like(pattern: str):
+    return _like_re.compile(_like_to_re(pattern))
+
+
 def match_like(pattern: str, strs: Sequence[str]) -> Iterable[str]:
-    reo = re.compile(pattern.replace("%", ".*").replace("?", ".") + "$")
+    match = _compile_like(pattern).match
     for s in strs:
-        if reo.match(s):
+        if match(s):
             yield s
 
 
@@ -394,16 +567,22 @@ def getLogger(name):
     return logging.getLogger(name.rsplit(".", 1)[-1])
 
 
+_TEMPLATE_RE = re.compile("%t")
+
+
 def eval_name_template(name):
     def get_timestamp(_match):
         return datetime.now().isoformat("_", "seconds").replace(":", "_")
 
-    return re.sub("%t", get_timestamp, name)
+    return _TEMPLATE_RE.sub(get_timestamp, name)
+
+
+_QUOTED_RE = re.compile("'(.*?)'")
 
 
 def truncate_error(error: str):
     first_line = error.split("\n", 1)[0]
-    return re.sub("'(.*?)'", "'***'", first_line)
+    return _QUOTED_RE.sub("'***'", first_line)
 
 
 def get_from_dict_with_raise(dictionary: Dict, key: str, exception: Exception):
@@ -424,34 +603,44 @@ class Vector(tuple):
     Partial implementation: Only the needed functionality is implemented
     """
 
+    def _check_len(self, other: "Vector") -> None:
+        if len(self) != len(other):
+            raise ValueError(f"Mismatching lengths in vector operation: {len(self)} != {len(other)}")
+
     def __lt__(self, other: "Vector") -> bool:
         if isinstance(other, Vector):
-            return all(a < b for a, b in safezip(self, other))
+            self._check_len(other)
+            return all(map(operator.lt, self, other))
         return NotImplemented
 
     def __le__(self, other: "Vector") -> bool:
         if isinstance(other, Vector):
-            return all(a <= b for a, b in safezip(self, other))
+            self._check_len(other)
+            return all(map(operator.le, self, other))
         return NotImplemented
 
     def __gt__(self, other: "Vector") -> bool:
         if isinstance(other, Vector):
-            return all(a > b for a, b in safezip(self, other))
+            self._check_len(other)
+            return all(map(operator.gt, self, other))
         return NotImplemented
 
     def __ge__(self, other: "Vector") -> bool:
         if isinstance(other, Vector):
-            return all(a >= b for a, b in safezip(self, other))
+            self._check_len(other)
+            return all(map(operator.ge, self, other))
         return NotImplemented
 
     def __eq__(self, other: "Vector") -> bool:
         if isinstance(other, Vector):
-            return all(a == b for a, b in safezip(self, other))
+            self._check_len(other)
+            return all(map(operator.eq, self, other))
         return NotImplemented
 
     def __sub__(self, other: "Vector") -> "Vector":
         if isinstance(other, Vector):
-            return Vector((a - b) for a, b in safezip(self, other))
+            self._check_len(other)
+            return Vector(map(operator.sub, self, other))
         raise NotImplementedError()
 
     def __repr__(self) -> str:
@@ -485,17 +674,19 @@ def diffs_are_equiv_jsons(diff: list, json_cols: dict):
     overriden_diff_cols = set()
     if (len(diff) != 2) or ({diff[0][0], diff[1][0]} != {"+", "-"}):
         return False, overriden_diff_cols
-    match = True
-    for i, (col_a, col_b) in enumerate(safezip(diff[0][1][1:], diff[1][1][1:])):  # index 0 is extra_columns first elem
-        # we only attempt to parse columns of JSON type, but we still need to check if non-json columns don't match
-        match = col_a == col_b
-        if not match and (i in json_cols):
-            if _jsons_equiv(col_a, col_b):
-                overriden_diff_cols.add(json_cols[i])
-                match = True
-        if not match:
-            break
-    return match, overriden_diff_cols
+    row_a = diff[0][1][1:]  # index 0 is extra_columns first elem
+    row_b = diff[1][1][1:]
+    if row_a == row_b:
+        return True, overriden_diff_cols
+    mismatches = [i for i, (col_a, col_b) in enumerate(_zip_checked(row_a, row_b)) if col_a != col_b]
+    # we only attempt to parse columns of JSON type, so any mismatching non-json column settles it without parsing
+    if not all(i in json_cols for i in mismatches):
+        return False, overriden_diff_cols
+    for i in mismatches:
+        if not _jsons_equiv(row_a[i], row_b[i]):
+            return False, set()
+        overriden_diff_cols.add(json_cols[i])
+    return True, overriden_diff_cols
 
 
 def columns_removed_template(columns_removed) -> str:
@@ -517,22 +708,39 @@ def no_differences_template() -> str:
     return "[bold][green]No row differences[/][/]\n"
 
 
-def print_version_info() -> None:
-    base_version_string = f"Running with data-diff={__version__}"
-    logger = getLogger(__name__)
-    latest_version = None
+_pypi_session = requests.Session()
+
+
+def _check_for_update(result: dict) -> None:
     try:
-        response = requests.get(url="https://pypi.org/pypi/data-diff/json", timeout=3)
+        response = _pypi_session.get(url="https://pypi.org/pypi/data-diff/json", timeout=3)
         response.raise_for_status()
-        response_json = response.json()
-        latest_version = response_json["info"]["version"]
+        latest_version = response.json()["info"]["version"]
+        if parse_version(__version__) < parse_version(latest_version):
+            result["update"] = latest_version
     except Exception as ex:
-        logger.debug(f"Failed checking version: {ex}")
+        getLogger(__name__).debug(f"Failed checking version: {ex}")
 
-    if latest_version and parse_version(__version__) < parse_version(latest_version):
-        print(f"{base_version_string} (Update {latest_version} is available!)")
-    else:
-        print(base_version_string)
+
+def _print_update_notice(result: dict) -> None:
+    if "update" in result:
+        print(f"Update {result['update']} is available! (Running with data-diff={__version__})")
+
+
+# The update check runs at most once per process, no matter how many times dbt_diff() is called
+_update_check_lock = threading.Lock()
+_update_check_thread: Optional[threading.Thread] = None
+_update_check_result: dict = {}
+
+
+def print_version_info() -> None:
+    global _update_check_thread
+    print(f"Running with data-diff={__version__}")
+    # Don't block startup on PyPI. The update notice (if any) is printed when the process exits.
+    with _update_check_lock:
+        if _update_check_thread is None:
+            _update_check_thread = run_as_daemon(_check_for_update, _update_check_result)
+            atexit.register(_print_update_notice, _update_check_result)
 
 
 class LogStatusHandler(logging.Handler):
@@ -1,6 +1,25 @@
+import io
 import unittest
-
-from data_diff.utils import remove_passwords_in_dict, match_regexps, match_like, number_to_human
+from contextlib import redirect_stdout
+from unittest.mock import Mock, patch
+
+import requests
+
+from data_diff import utils
+from data_diff.version import __version__
+
+from data_diff.utils import (
+    remove_passwords_in_dict,
+    match_regexps,
+    match_like,
+    number_to_human,
+    is_uuid,
+    alphanums,
+    alphanumToNumber,
+    numberToAlphanum,
+    diffs_are_equiv_jsons,
+    print_version_info,
+)
 from data_diff.__main__ import _remove_passwords_in_dict
 
 
@@ -104,6 +123,12 @@ class TestUtils(unittest.TestCase):
         result = list(match_like(pattern, strs))
         self.assertEqual(result, ["abc"])
 
+        # Test regex metacharacters are matched literally
+        result = list(match_like("a.c", ["abc", "a.c"]))
+        self.assertEqual(result, ["a.c"])
+        result = list(match_like("col(1)+%", ["col(1)+x", "col1x", "coll)+x"]))
+        self.assertEqual(result, ["col(1)+x"])
+
     def test_number_to_human(self):
         # Test basic conversion
         assert number_to_human(1000) == "1k"
@@ -123,3 +148,97 @@ class TestUtils(unittest.TestCase):
         assert number_to_human(-1000) == "-1k"
         assert number_to_human(-1000000) == "-1m"
         assert number_to_human(-1000000000) == "-1b"
+
+    def test_is_uuid(self):
+        assert is_uuid("3f2a6c1e-6a9b-4b1f-8d7e-2c4f5a6b7c8d")
+        assert is_uuid("3F2A6C1E-6A9B-4B1F-8D7E-2C4F5A6B7C8D")
+
+        # Not UUIDs: md5 hex, wrong dashes, non-hex chars, embedded whitespace
+        assert not is_uuid("5d41402abc4b2a76b9719d911017c592")
+        assert not is_uuid("3f2a6c1e6-a9b-4b1f-8d7e-2c4f5a6b7c8d")
+        assert not is_uuid("3f2a6c1e-6a9b-4b1f-8d7e-2c4f5a6b7c8g")
+        assert not is_uuid("3f  6c1e-6a9b-4b1f-8d7e-2c4f5a6b7c8d")
+        assert not is_uuid("")
+
+    def test_alphanum_conversion(self):
+        assert numberToAlphanum(0) == ""
+        assert alphanumToNumber("") == 0
+        assert numberToAlphanum(5, "01") == "101"
+        assert alphanumToNumber("101", "01") == 5
+
+        # Long strings go through the divide-and-conquer path
+        for length in (1, 31, 32, 33, 64, 100, 1000):
+            s = "".join(alphanums[1 + (i * 7) % (len(alphanums) - 1)] for i in range(length))
+            n = alphanumToNumber(s)
+            assert n == sum(alphanums.index(c) * len(alphanums) ** i for i, c in enumerate(reversed(s)))
+            assert numberToAlphanum(n) == s
+
+        # Invalid characters raise ValueError, on both the short and the long path
+        with self.assertRaises(ValueError):
+            alphanumToNumber("ab!c")
+        with self.assertRaises(ValueError):
+            alphanumToNumber("a" * 100 + "!")
+
+        # Inner zero digits are kept when splitting
+        n = len(alphanums) ** 100
+        assert numberToAlphanum(n) == alphanums[1] + alphanums[0] * 100
+
+    def test_diffs_are_equiv_jsons(self):
+        json_cols = {1: "data"}
+
+        # Identical rows
+        diff = [("-", ("1", "a", '{"x": 1}')), ("+", ("1", "a", '{"x": 1}'))]
+        assert diffs_are_equiv_jsons(diff, json_cols) == (True, set())
+
+        # Only the JSON representation differs
+        diff = [("-", ("1", "a", '{"x": 1, "y": 2}')), ("+", ("1", "a", '{"y":2,"x":1}'))]
+        assert diffs_are_equiv_jsons(diff, json_cols) == (True, {"data"})
+
+        # A non-JSON column differs as well
+        diff = [("-", ("1", "a", '{"x": 1}')), ("+", ("1", "b", '{"x":1}'))]
+        assert diffs_are_equiv_jsons(diff, json_cols) == (False, set())
+
+        # The JSON values are different
+        diff = [("-", ("1", "a", '{"x": 1}')), ("+", ("1", "a", '{"x": 2}'))]
+        assert diffs_are_equiv_jsons(diff, json_cols) == (False, set())
+
+        # Not a +/- pair
+        diff = [("-", ("1", "a", '{"x": 1}'))]
+        assert diffs_are_equiv_jsons(diff, json_cols) == (False, set())
+
+
+class TestPrintVersionInfo(unittest.TestCase):
+    def _run(self, get_mock, calls=2):
+        with patch.object(utils, "_update_check_thread", None), patch.object(
+            utils, "_update_check_result", {}
+        ), patch.object(utils._pypi_session, "get", get_mock), patch.object(utils.atexit, "register") as mock_register:
+            out = io.StringIO()
+            with redirect_stdout(out):
+                for _ in range(calls):
+                    print_version_info()
+            # The version line is printed right away, before the check finishes
+            assert out.getvalue().splitlines() == [f"Running with data-diff={__version__}"] * calls
+
+            utils._update_check_thread.join(timeout=5)
+            get_mock.assert_called_once()
+            mock_register.assert_called_once()
+
+            out = io.StringIO()
+            with redirect_stdout(out):
+                handler, *args = mock_register.call_args.args
+                handler(*args)
+            return out.getvalue()
+
+    def test_update_available(self):
+        response = Mock()
+        response.json.return_value = {"info": {"version": "999.0.0"}}
+        notice = self._run(Mock(return_value=response))
+        assert notice == f"Update 999.0.0 is available! (Running with data-diff={__version__})\n"
+
+    def test_no_update(self):
+        response = Mock()
+        response.json.return_value = {"info": {"version": __version__}}
+        assert self._run(Mock(return_value=response)) == ""
+
+    def test_failed_request(self):
+        assert self._run(Mock(side_effect=requests.ConnectionError("offline"))) == ""